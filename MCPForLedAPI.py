@@ -1,31 +1,150 @@
 import asyncio
-import requests
+import re
+import time
+from functools import partial
+from collections.abc import Awaitable, Callable
+import aiohttp
 from mcp.server import Server
 from mcp.types import Tool, TextContent
 import mcp.server.stdio
 
+# uvloop is optional (not available on Windows), fall back to the default asyncio loop
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 LED_API_BASE = "http://localhost:5000" #the url for the LED API used to communicate with the Arduino
 
+# Shared HTTP session for the LED API, opened in main() so tool calls never block the event loop
+_session: aiohttp.ClientSession | None = None
+
+# Precompiled validators for the pattern fields
+_SIMPLE_RE = re.compile(r"[01]{4}")
+_STATE_RE = re.compile(r"[012]{4}")
+_ORDER_RE = re.compile(r"[01234]{4}")
+
+# Simple patterns have only 16 values, so their JSON bodies are serialized once up front
+_SIMPLE_PAYLOADS = {f"{i:04b}": f'{{"pattern":"{i:04b}"}}'.encode() for i in range(16)}
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Repeating the last pattern within this window (seconds) reuses the previous API response
+PATTERN_CACHE_TTL = 0.25
+
+_last_pattern: str | None = None
+_last_result = None
+_last_ts = 0.0
+
+# Posts a validated pattern, waits for the LED API to acknowledge it and returns a small
+# ack dict naming the pattern sent. Raises on a non-2xx reply. Back-to-back duplicates
+# within the TTL reuse the previous ack without posting
+async def _post_write_ack(pattern: str):
+    global _last_pattern, _last_result, _last_ts
+    if pattern == _last_pattern and time.monotonic() - _last_ts < PATTERN_CACHE_TTL:
+        return _last_result
+
+    # Invalidate first so a failed or in-flight write is never served from the cache
+    _last_pattern = None
+    payload = _SIMPLE_PAYLOADS.get(pattern)
+    if payload is not None:
+        request = _session.post("/setLedStatus", data=payload, headers=_JSON_HEADERS)
+    else:
+        # Extended patterns are unbounded, let aiohttp encode them
+        request = _session.post("/setLedStatus", json={"pattern": pattern})
+    async with request as res:
+        # Read the ack so the connection goes back to the keep-alive pool, but only
+        # decode it for error reporting, callers just need to know the write landed
+        body = await res.read()
+    if not res.ok:
+        raise RuntimeError(f"LED API returned {res.status}: {body.decode(errors='replace')}")
+    result = {"ok": True, "status": res.status, "pattern": pattern}
+    _last_pattern, _last_result, _last_ts = pattern, result, time.monotonic()
+    return result
+
+# Writes arriving within this window (seconds) are merged and only the latest pattern is sent.
+# Callers whose pattern was dropped get PatternSuperseded instead of a success result.
+# Dropping intermediate patterns is only acceptable because an LED display just needs
+# to end up in its final state.
+PATTERN_COALESCE_WINDOW = 0.02
+
+# Raised to a caller whose pattern was merged away by a later write in the same batch
+class PatternSuperseded(Exception):
+    def __init__(self, pattern: str, result: dict):
+        super().__init__(f"LED pattern {pattern} was superseded by {result['pattern']}")
+        self.pattern = pattern
+        self.result = result
+
+_pending: asyncio.Future | None = None
+_pending_pattern: str | None = None
+_flush_tasks: set[asyncio.Task] = set()
+# Batches are posted one at a time, in the order they started, so a slow write can never
+# land after a newer one and leave the LEDs in a stale state
+_flush_lock = asyncio.Lock()
+
+async def _coalesce_pattern(pattern: str):
+    global _pending, _pending_pattern
+    _pending_pattern = pattern
+    if _pending is None:
+        loop = asyncio.get_running_loop()
+        _pending = loop.create_future()
+        _pending.add_done_callback(_consume_exception)
+        loop.call_later(PATTERN_COALESCE_WINDOW, _schedule_flush)
+    # Shield the shared future so one cancelled caller does not cancel the write for the others
+    result = await asyncio.shield(_pending)
+    if result["pattern"] != pattern:
+        raise PatternSuperseded(pattern, result)
+    return result
+
+# If every caller was cancelled nobody awaits the future, mark a failure as retrieved
+# so asyncio does not log "Future exception was never retrieved"
+def _consume_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+def _schedule_flush():
+    task = asyncio.get_running_loop().create_task(_flush())
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
+
+async def _flush():
+    global _pending, _pending_pattern
+    # The batch stays open while an earlier flush holds the lock, so writes arriving
+    # in the meantime still join it and only the latest pattern is sent
+    future = _pending
+    try:
+        async with _flush_lock:
+            pattern = _pending_pattern
+            _pending = _pending_pattern = None
+            future.set_result(await _post_write_ack(pattern))
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        # A cancelled flush must not leave waiters hanging on the shared future
+        if _pending is future:
+            _pending = _pending_pattern = None
+        if not future.done():
+            future.cancel()
+
 # LED Pattern Translator, supports both simple and extended formats
 # Simple format: "1010" (4-digit LED state)
 # Extended format: "SSSS:OOOO:III" (state:order:interval)
 
-def set_led_pattern(pattern: str):
+async def set_led_pattern(pattern: str):
     # Check if it's the extended format with blinking support
     if ":" in pattern:
         # Extended format: SSSS:OOOO:III
-        parts = pattern.split(":")
-        if len(parts) != 3:
+        # Fields are fixed width, so slice at the separator offsets instead of splitting
+        if len(pattern) < 10 or pattern[4] != ":" or pattern[9] != ":":
             raise ValueError("Extended pattern format must be SSSS:OOOO:III")
 
-        state, order, interval = parts
+        state, order, interval = pattern[0:4], pattern[5:9], pattern[10:]
 
         # Validate state (4 digits: 0=off, 1=on steady, 2=blink)
-        if len(state) != 4 or any(c not in "012" for c in state):
+        if not _STATE_RE.fullmatch(state):
             raise ValueError("State must be 4 digits of 0s, 1s, or 2s (0=off, 1=on, 2=blink)")
 
         # Validate order (4 digits: 0=no sequence, 1-4=order position)
-        if len(order) != 4 or any(c not in "01234" for c in order):
+        if not _ORDER_RE.fullmatch(order):
             raise ValueError("Order must be 4 digits of 0-4 (0=no sequence, 1-4=position)")
 
         # Validate interval (must be numeric)
@@ -33,19 +152,20 @@ def set_led_pattern(pattern: str):
             raise ValueError("Interval must be a numeric value in milliseconds")
 
         # Send extended format to Arduino
-        res = requests.post(f"{LED_API_BASE}/setLedStatus", json={"pattern": pattern})
-        return res.json()
+        return await _coalesce_pattern(pattern)
     else:
         # Simple backward-compatible format: 4-digit binary
-        if len(pattern) != 4 or any(c not in "01" for c in pattern):
+        if not _SIMPLE_RE.fullmatch(pattern):
             raise ValueError("Invalid LED pattern format. Must be 4 digits of 0s and 1s.")
-        res = requests.post(f"{LED_API_BASE}/setLedStatus", json={"pattern": pattern})
-        return res.json()
+        return await _coalesce_pattern(pattern)
 
 # Returns the current LED status from the API
-def get_led_status():
-    res = requests.get(f"{LED_API_BASE}/status")
-    return res.json()
+async def get_led_status():
+    global _last_pattern
+    # A status refresh may reveal changes made outside this server, so drop the write cache
+    _last_pattern = None
+    async with _session.get("/status") as res:
+        return await res.json(content_type=None)
 
 # Mood patterns mapping
 MOOD_PATTERNS = {
@@ -83,175 +203,230 @@ COLOR_PATTERNS = {
     "blue": "0001"
 }
 
+# LED colors in pattern digit order
+LED_COLORS = ("red", "yellow", "green", "blue")
+
 # Create MCP server
 app = Server("led-controller")
 
-@app.list_tools()
-async def list_tools() -> list[Tool]:
-    return [
-        Tool(
-            name="turn_on_led",
-            description="Turn on a specific LED by color. Available colors: red, yellow, green, blue",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "color": {
-                        "type": "string",
-                        "description": "The color of the LED to turn on",
-                        "enum": ["red", "yellow", "green", "blue"]
-                    }
-                },
-                "required": ["color"]
-            }
-        ),
-        Tool(
-            name="turn_off_leds",
-            description="Turn off all LEDs",
-            inputSchema={
-                "type": "object",
-                "properties": {}
-            }
-        ),
-        Tool(
-            name="set_led_pattern",
-            description="Set a specific LED pattern using a 4-digit binary string (e.g., '1010' for red and green)",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "pattern": {
-                        "type": "string",
-                        "description": "4-digit binary pattern (e.g., '1010')",
-                        "pattern": "^[01]{4}$"
-                    }
-                },
-                "required": ["pattern"]
-            }
-        ),
-        Tool(
-            name="set_mood",
-            description=f"Set LED pattern based on a mood. Available moods: {', '.join(MOOD_PATTERNS.keys())}",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "mood": {
-                        "type": "string",
-                        "description": "The mood to set",
-                        "enum": list(MOOD_PATTERNS.keys())
-                    }
+# Tool definitions are static, so build them once and serve the same list on every request
+_TOOLS: list[Tool] = [
+    Tool(
+        name="turn_on_led",
+        description="Turn on a specific LED by color. Available colors: red, yellow, green, blue",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "color": {
+                    "type": "string",
+                    "description": "The color of the LED to turn on",
+                    "enum": ["red", "yellow", "green", "blue"]
+                }
+            },
+            "required": ["color"]
+        }
+    ),
+    Tool(
+        name="turn_off_leds",
+        description="Turn off all LEDs",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    Tool(
+        name="set_led_pattern",
+        description="Set a specific LED pattern using a 4-digit binary string (e.g., '1010' for red and green)",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "pattern": {
+                    "type": "string",
+                    "description": "4-digit binary pattern (e.g., '1010')",
+                    "pattern": "^[01]{4}$"
+                }
+            },
+            "required": ["pattern"]
+        }
+    ),
+    Tool(
+        name="set_mood",
+        description=f"Set LED pattern based on a mood. Available moods: {', '.join(MOOD_PATTERNS.keys())}",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "mood": {
+                    "type": "string",
+                    "description": "The mood to set",
+                    "enum": list(MOOD_PATTERNS.keys())
+                }
+            },
+            "required": ["mood"]
+        }
+    ),
+    Tool(
+        name="get_led_status",
+        description="Get the current status of all LEDs",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        }
+    ),
+    Tool(
+        name="set_blink_pattern",
+        description="Set LEDs with blinking support. Each LED can be off (0), on steady (1), or blinking (2). Optionally configure blink sequence order and interval.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "led_states": {
+                    "type": "string",
+                    "description": "4-digit state pattern (0=off, 1=on steady, 2=blink). Example: '2020' for LEDs 1&3 blinking",
+                    "pattern": "^[012]{4}$"
                 },
-                "required": ["mood"]
-            }
-        ),
-        Tool(
-            name="get_led_status",
-            description="Get the current status of all LEDs",
-            inputSchema={
-                "type": "object",
-                "properties": {}
-            }
-        ),
-        Tool(
-            name="set_blink_pattern",
-            description="Set LEDs with blinking support. Each LED can be off (0), on steady (1), or blinking (2). Optionally configure blink sequence order and interval.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "led_states": {
-                        "type": "string",
-                        "description": "4-digit state pattern (0=off, 1=on steady, 2=blink). Example: '2020' for LEDs 1&3 blinking",
-                        "pattern": "^[012]{4}$"
-                    },
-                    "blink_order": {
-                        "type": "string",
-                        "description": "4-digit blink sequence order (0=no sequence, 1-4=position). Example: '1234' for sequential. Default: '0000' (simultaneous)",
-                        "pattern": "^[01234]{4}$",
-                        "default": "0000"
-                    },
-                    "interval_ms": {
-                        "type": "number",
-                        "description": "Blink interval in milliseconds. Default: 500",
-                        "default": 500,
-                        "minimum": 50,
-                        "maximum": 10000
-                    }
+                "blink_order": {
+                    "type": "string",
+                    "description": "4-digit blink sequence order (0=no sequence, 1-4=position). Example: '1234' for sequential. Default: '0000' (simultaneous)",
+                    "pattern": "^[01234]{4}$",
+                    "default": "0000"
                 },
-                "required": ["led_states"]
-            }
-        )
+                "interval_ms": {
+                    "type": "number",
+                    "description": "Blink interval in milliseconds. Default: 500",
+                    "default": 500,
+                    "minimum": 50,
+                    "maximum": 10000
+                }
+            },
+            "required": ["led_states"]
+        }
+    )
+]
+
+@app.list_tools()
+async def list_tools() -> list[Tool]:
+    return _TOOLS
+
+# Tool handlers, one per MCP tool, dispatched by name from call_tool
+
+# Response text is built internally and trusted, so skip pydantic validation on TextContent
+_TEXT = partial(TextContent.model_construct, type="text")
+
+# Response templates shared by the handlers
+_MSG_TURN_ON = "Turned on {} LED. Result: {}"
+_MSG_SET_PATTERN = "Set LED pattern to {}. Result: {}"
+_MSG_SET_MOOD = "Set mood to '{}' with pattern {}. Result: {}"
+_MSG_STATUS = "LED Status: {}"
+_MSG_BLINK = "Set blink pattern: {} at {}ms interval. Result: {}"
+_MSG_SUPERSEDED = "LED pattern {} was not applied, a later command in the same batch set pattern {}. Result: {}"
+
+# Defaults for the optional set_blink_pattern arguments, read from its input schema
+# so the two cannot drift apart
+_BLINK_DEFAULTS = {
+    name: prop["default"]
+    for tool in _TOOLS if tool.name == "set_blink_pattern"
+    for name, prop in tool.inputSchema["properties"].items() if "default" in prop
+}
+
+# Failed and superseded writes raise, so turn_off_leds only returns this once its own
+# "0000" was sent
+_OFF_OK = [_TEXT(text="Turned off all LEDs.")]
+
+async def _h_turn_on_led(arguments: dict) -> list[TextContent]:
+    color = arguments["color"]
+    pattern = COLOR_PATTERNS.get(color)
+    if not pattern:
+        raise ValueError(f"Unsupported color: {color}")
+    result = await set_led_pattern(pattern)
+    return [_TEXT(text=_MSG_TURN_ON.format(color, result))]
+
+async def _h_turn_off_leds(arguments: dict) -> list[TextContent]:
+    await set_led_pattern("0000")
+    return _OFF_OK
+
+async def _h_set_led_pattern(arguments: dict) -> list[TextContent]:
+    pattern = arguments["pattern"]
+    result = await set_led_pattern(pattern)
+    return [_TEXT(text=_MSG_SET_PATTERN.format(pattern, result))]
+
+async def _h_set_mood(arguments: dict) -> list[TextContent]:
+    mood = arguments["mood"]
+    pattern = MOOD_PATTERNS.get(mood)
+    if not pattern:
+        raise ValueError(f"Unsupported mood: {mood}")
+    result = await set_led_pattern(pattern)
+    return [_TEXT(text=_MSG_SET_MOOD.format(mood, pattern, result))]
+
+async def _h_get_led_status(arguments: dict) -> list[TextContent]:
+    result = await get_led_status()
+    return [_TEXT(text=_MSG_STATUS.format(result))]
+
+async def _h_set_blink_pattern(arguments: dict) -> list[TextContent]:
+    args = {**_BLINK_DEFAULTS, **arguments}
+    led_states = args["led_states"]
+    blink_order = args["blink_order"]
+    interval_ms = args["interval_ms"]
+
+    # extended pattern format: SSSS:OOOO:III
+    extended_pattern = f"{led_states}:{blink_order}:{interval_ms}"
+    result = await set_led_pattern(extended_pattern)
+
+    # Build readable description
+    state_desc = [
+        f"{color} steady" if state == "1"
+        else f"{color} blinking" if order_pos == "0"
+        else f"{color} blinking (seq {order_pos})"
+        for color, state, order_pos in zip(LED_COLORS, led_states, blink_order)
+        if state != "0"
     ]
 
+    desc_text = ", ".join(state_desc) if state_desc else "all LEDs off"
+    return [_TEXT(text=_MSG_BLINK.format(desc_text, interval_ms, result))]
+
+_HANDLERS: dict[str, Callable[[dict], Awaitable[list[TextContent]]]] = {
+    "turn_on_led": _h_turn_on_led,
+    "turn_off_leds": _h_turn_off_leds,
+    "set_led_pattern": _h_set_led_pattern,
+    "set_mood": _h_set_mood,
+    "get_led_status": _h_get_led_status,
+    "set_blink_pattern": _h_set_blink_pattern
+}
+
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     try:
-        if name == "turn_on_led":
-            color = arguments["color"].lower()
-            pattern = COLOR_PATTERNS.get(color)
-            if not pattern:
-                raise ValueError(f"Unsupported color: {color}")
-            result = set_led_pattern(pattern)
-            return [TextContent(type="text", text=f"Turned on {color} LED. Result: {result}")]
-
-        elif name == "turn_off_leds":
-            result = set_led_pattern("0000")
-            return [TextContent(type="text", text=f"Turned off all LEDs. Result: {result}")]
-
-        elif name == "set_led_pattern":
-            pattern = arguments["pattern"]
-            result = set_led_pattern(pattern)
-            return [TextContent(type="text", text=f"Set LED pattern to {pattern}. Result: {result}")]
-
-        elif name == "set_mood":
-            mood = arguments["mood"].lower()
-            pattern = MOOD_PATTERNS.get(mood)
-            if not pattern:
-                raise ValueError(f"Unsupported mood: {mood}")
-            result = set_led_pattern(pattern)
-            return [TextContent(type="text", text=f"Set mood to '{mood}' with pattern {pattern}. Result: {result}")]
-
-        elif name == "get_led_status":
-            result = get_led_status()
-            return [TextContent(type="text", text=f"LED Status: {result}")]
-
-        elif name == "set_blink_pattern":
-            led_states = arguments["led_states"]
-            blink_order = arguments.get("blink_order", "0000")
-            interval_ms = arguments.get("interval_ms", 500)
-
-            # extended pattern format: SSSS:OOOO:III
-            extended_pattern = f"{led_states}:{blink_order}:{interval_ms}"
-            result = set_led_pattern(extended_pattern)
-
-            # Build readable description
-            state_desc = []
-            for i, state in enumerate(led_states):
-                led_colors = ["red", "yellow", "green", "blue"]
-                if state == "1":
-                    state_desc.append(f"{led_colors[i]} steady")
-                elif state == "2":
-                    order_pos = blink_order[i]
-                    if order_pos == "0":
-                        state_desc.append(f"{led_colors[i]} blinking")
-                    else:
-                        state_desc.append(f"{led_colors[i]} blinking (seq {order_pos})")
-
-            desc_text = ", ".join(state_desc) if state_desc else "all LEDs off"
-            return [TextContent(type="text", text=f"Set blink pattern: {desc_text} at {interval_ms}ms interval. Result: {result}")]
-
-        else:
+        handler = _HANDLERS.get(name)
+        if handler is None:
             raise ValueError(f"Unknown tool: {name}")
+        return await handler(arguments)
 
+    except PatternSuperseded as e:
+        return [_TEXT(text=_MSG_SUPERSEDED.format(e.pattern, e.result["pattern"], e.result))]
     except Exception as e:
-        return [TextContent(type="text", text=f"Error: {str(e)}")]
+        return [_TEXT(text=f"Error: {str(e)}")]
 
 async def main():
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            app.create_initialization_options()
-        )
+    global _session
+    # Keep-alive pool so repeated LED commands reuse the socket to the LED API
+    connector = aiohttp.TCPConnector(limit=16, keepalive_timeout=30)
+    async with aiohttp.ClientSession(base_url=LED_API_BASE, connector=connector) as _session:
+        # Warm up the connection pool so the first LED command doesn't pay for the connect.
+        # The LED API may not be up yet, which is fine, tool calls will report it then
+        try:
+            await asyncio.wait_for(get_led_status(), timeout=0.5)
+        except Exception:
+            pass
+
+        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await app.run(
+                read_stream,
+                write_stream,
+                app.create_initialization_options()
+            )
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 
 